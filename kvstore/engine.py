@@ -1,11 +1,87 @@
+from array import array
+import bisect
+from collections import OrderedDict, defaultdict
+import concurrent.futures
+import heapq
+import math
+import mmap
+import operator
 import os
 from pathlib import Path
-import json
+import queue
+import struct
+import threading
 import time
-import uuid
+from typing import NamedTuple
+
+import msgspec
+from pybloom_live import BloomFilter
+from sortedcontainers import SortedDict
+
+class Version(NamedTuple):
+    value: str
+    timestamp: float
+    expires_at: float
+    is_tombstone: bool = False
+
+class VersionColumns:
+    """Struct-of-arrays store for one key's memstore versions
+
+    Parallel columns keep timestamps/expiries in contiguous array('d')
+    buffers instead of one heap-allocated tuple per version, so the
+    reverse TTL scan walks packed doubles rather than chasing pointers.
+    """
+    __slots__ = ("values", "timestamps", "expires", "tombstones")
+
+    def __init__(self):
+        self.values = []
+        self.timestamps = array("d")
+        self.expires = array("d")
+        self.tombstones = bytearray()
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value, timestamp, expires_at, is_tombstone=False):
+        self.values.append(value)
+        self.timestamps.append(timestamp)
+        self.expires.append(expires_at)
+        self.tombstones.append(1 if is_tombstone else 0)
+
+    def latest_live(self, now):
+        """Newest version still alive at `now`, or None"""
+        expires = self.expires
+        for i in range(len(expires) - 1, -1, -1):
+            if now <= expires[i]:
+                return Version(self.values[i], self.timestamps[i], expires[i], bool(self.tombstones[i]))
+        return None
+
+    def rows(self):
+        """Materialize the columns as Version tuples for encoding"""
+        return [
+            Version(value, timestamp, expires_at, bool(tombstone))
+            for value, timestamp, expires_at, tombstone
+            in zip(self.values, self.timestamps, self.expires, self.tombstones)
+        ]
+
+class WalEntry(msgspec.Struct):
+    timestamp: float
+    operation: str
+    namespace: str
+    table: str
+    key: str
+    value: str | None
+    ttl: float
 
 class KVEngine:
     MAX_MEM_SIZE = 1024 * 1024
+    WAL_BATCH_SIZE = 32
+    WAL_GROUP_COMMIT_OPS = 64
+    WAL_GROUP_COMMIT_INTERVAL = 0.05  # seconds
+    SPARSE_INDEX_STEP = 16
+    COMPACT_TIER_THRESHOLD = 4
+    FD_CACHE_SIZE = 32
+    READ_CACHE_SIZE = 4096
 
     def __init__(self):
         self.current_ns = None
@@ -14,39 +90,315 @@ class KVEngine:
         self.wal_dir = self.kv_root / "wal"
         self.wal_dir.mkdir(parents=True, exist_ok=True)
         self.memstore = {}
-
-    def _write_to_wal(self, operation: str, table: str, key: str, value: str = None, ttl: float = 0):
-        """Write operation to WAL file"""
+        self._memstore_bytes = defaultdict(int)
+        self._namespaces = None  # lazily scanned once, then kept in sync
+        self._tables = {}  # ns -> set of table names
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder(dict)
+        self._record_decoder = msgspec.msgpack.Decoder(tuple[str, list[Version]])
+        self._bloom_cache = {}  # sst path -> BloomFilter (or None if no sidecar)
+        self._index_cache = {}  # sst path -> decoded sparse index
+        self._table_paths = {}  # table_id -> resolved directory path string
+        self._fd_cache = OrderedDict()  # sst path -> open fd, LRU-capped
+        self._read_cache = OrderedDict()  # (table_id, key) -> (value, expires_at)
+
+        # One re-entrant lock guards the public API so background flushes
+        # and batched writers can't race memstore mutation
+        self._lock = threading.RLock()
+
+        # Flushes run on a single background worker; flushed snapshots are
+        # parked in _frozen (a list per table, oldest first) so reads still
+        # see them until they reach disk.
+        self._flush_seq = 0
+        self._flush_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._frozen = {}
+        self._pending_flushes = []
+
+        # Single append-only WAL file; frames are queued and written in
+        # batches by a background thread so the hot path never blocks on I/O.
+        self._wal_fd = os.open(self.wal_dir / "wal.log", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._wal_queue = queue.Queue()
+        self._wal_error = None  # first write/fsync failure, surfaced on sync
+        self._wal_unsynced_ops = 0
+        self._last_wal_sync = time.time()
+        self._wal_thread = threading.Thread(target=self._wal_writer, daemon=True)
+        self._wal_thread.start()
+
+    def _wal_writer(self):
+        """Background loop draining queued WAL frames in batches"""
+        while True:
+            frames = [self._wal_queue.get()]
+            # Drain whatever else is pending, up to the batch limit, so one
+            # write syscall covers many operations.
+            while len(frames) < self.WAL_BATCH_SIZE:
+                try:
+                    frames.append(self._wal_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.write(self._wal_fd, b"".join(frames))
+
+                # Group commit: fsync once per batch window instead of per op
+                self._wal_unsynced_ops += len(frames)
+                if (self._wal_unsynced_ops >= self.WAL_GROUP_COMMIT_OPS
+                        or time.time() - self._last_wal_sync >= self.WAL_GROUP_COMMIT_INTERVAL):
+                    self.group_commit()
+            except OSError as e:
+                # Keep the first failure; it resurfaces on the next sync
+                # instead of silently acking writes that never hit the log
+                if self._wal_error is None:
+                    self._wal_error = e
+            finally:
+                # Always retire the frames so fsync_wal's queue join can
+                # never deadlock on a failed write
+                for _ in frames:
+                    self._wal_queue.task_done()
+
+    def _write_to_wal(self, operation: str, table: str, key: str, value: str = None, ttl: float = 0, timestamp: float = None):
+        """Queue operation as a length-prefixed frame on the shared WAL"""
         if self.current_namespace is None:
             raise ValueError("No namespace selected. Use 'use-namespace' first.")
 
         # Create WAL entry
-        wal_entry = {
-            "timestamp": time.time(),
-            "operation": operation,
-            "namespace": self.current_namespace,
-            "table": table,
-            "key": key,
-            "value": value,
-            "ttl": ttl
+        wal_entry = WalEntry(
+            timestamp=timestamp if timestamp is not None else time.time(),
+            operation=operation,
+            namespace=self.current_namespace,
+            table=table,
+            key=key,
+            value=value,
+            ttl=ttl
+        )
+        self._write_wal_entries([wal_entry])
+
+    def _write_wal_entries(self, entries):
+        """Queue a batch of WAL entries as one length-prefixed frame"""
+        # Frame = 4-byte big-endian length + msgpack payload
+        payload = self._encoder.encode(entries)
+        self._wal_queue.put(struct.pack(">I", len(payload)) + payload)
+
+    def group_commit(self):
+        """Fsync the WAL once for everything written since the last sync
+
+        Re-raises any write/fsync failure recorded by the WAL writer thread
+        rather than reporting a log that lost frames as durable.
+        """
+        if self._wal_error is not None:
+            raise self._wal_error
+        os.fsync(self._wal_fd)
+        self._wal_unsynced_ops = 0
+        self._last_wal_sync = time.time()
+
+    def fsync_wal(self):
+        """Block until all queued WAL frames are on disk"""
+        self._wal_queue.join()
+        self.group_commit()
+
+    def read_wal(self):
+        """Yield every WalEntry recorded in the shared WAL, oldest first"""
+        wal_path = self.wal_dir / "wal.log"
+        if not wal_path.exists():
+            return
+        decoder = msgspec.msgpack.Decoder(list[WalEntry])
+        with open(wal_path, "rb") as f:
+            buf = f.read()
+        pos = 0
+        while pos + 4 <= len(buf):
+            length = struct.unpack_from(">I", buf, pos)[0]
+            if pos + 4 + length > len(buf):  # torn tail write
+                break
+            yield from decoder.decode(buf[pos + 4:pos + 4 + length])
+            pos += 4 + length
+
+    def _write_sstable(self, sst_path, data):
+        """Write an SSTable in sorted key order plus its index and Bloom sidecars
+
+        The SSTable is a sequence of length-prefixed msgpack (key, versions)
+        records. A sparse index (every SPARSE_INDEX_STEP-th key with its byte
+        offset) lets reads pread just the enclosing block instead of the file.
+        """
+        # Memstore snapshots are SortedDicts and arrive pre-sorted
+        sorted_keys = list(data) if isinstance(data, SortedDict) else sorted(data)
+        bloom = BloomFilter(capacity=max(len(sorted_keys), 1), error_rate=0.01)
+        index_keys = []
+        index_offsets = []
+
+        offset = 0
+        tmp_path = sst_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for i, key in enumerate(sorted_keys):
+                if i % self.SPARSE_INDEX_STEP == 0:
+                    index_keys.append(key)
+                    index_offsets.append(offset)
+                bloom.add(key)
+                versions = data[key]
+                if isinstance(versions, VersionColumns):
+                    versions = versions.rows()
+                payload = self._encoder.encode((key, versions))
+                f.write(struct.pack(">I", len(payload)) + payload)
+                offset += 4 + len(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        index = {
+            "min": sorted_keys[0] if sorted_keys else "",
+            "max": sorted_keys[-1] if sorted_keys else "",
+            "keys": index_keys,
+            "offsets": index_offsets,
+            "size": offset
         }
-
-        # Write to WAL file
-        wal_file = self.wal_dir / f"{self.current_namespace}_{table}_{uuid.uuid4()}.wal"
-        with open(wal_file, "w") as f:
-            json.dump(wal_entry, f, indent=4)
+        self._atomic_write(sst_path[:-4] + ".idx", self._encoder.encode(index))
+        with open(sst_path[:-4] + ".bloom.tmp", "wb") as f:
+            bloom.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(sst_path[:-4] + ".bloom.tmp", sst_path[:-4] + ".bloom")
+
+        # Sidecars land before the SSTable itself becomes visible, so a
+        # crash can never leave a readable SSTable with missing sidecars
+        os.replace(tmp_path, sst_path)
+
+        # May run on the flush executor thread; publish the sidecar caches
+        # under the lock alongside the readers that consult them
+        with self._lock:
+            self._bloom_cache[sst_path] = bloom
+            self._index_cache[sst_path] = index
+
+    @staticmethod
+    def _atomic_write(path: str, payload: bytes):
+        """Write bytes to path via a fsync'd temp file and os.replace"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _table_dir(self, table_id: str) -> str:
+        """Cached directory path string for a table (avoids Path arithmetic)"""
+        path = self._table_paths.get(table_id)
+        if path is None:
+            ns, table = table_id.split(":", 1)
+            path = str(self.kv_root / ns / table)
+            self._table_paths[table_id] = path
+        return path
+
+    def _sstable_files(self, table_id: str):
+        """Yield the table's SSTable paths via a single scandir pass"""
+        with os.scandir(self._table_dir(table_id)) as it:
+            for entry in it:
+                if entry.name.endswith(".sst"):
+                    yield entry.path
+
+    def _load_index(self, file_path: str):
+        """Load the sparse index sidecar for an SSTable, caching per process"""
+        if file_path not in self._index_cache:
+            idx_path = file_path[:-4] + ".idx"
+            if os.path.exists(idx_path):
+                with open(idx_path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._index_cache[file_path] = self._decoder.decode(mm)
+                    mm.close()
+            else:
+                self._index_cache[file_path] = None
+        return self._index_cache[file_path]
+
+    def _read_key_from_sstable(self, file_path, key):
+        """Point lookup: bisect the sparse index and pread one block"""
+        index = self._load_index(file_path)
+        if index is None or not index["keys"]:
+            return None
+        if key < index["min"] or key > index["max"]:
+            return None
+
+        # Find the sparse block whose first key is <= key
+        block = bisect.bisect_right(index["keys"], key) - 1
+        start = index["offsets"][block]
+        end = index["offsets"][block + 1] if block + 1 < len(index["offsets"]) else index["size"]
+
+        buf = os.pread(self._sstable_fd(file_path), end - start, start)
+
+        # Walk the block's length-prefixed records
+        pos = 0
+        while pos < len(buf):
+            length = struct.unpack_from(">I", buf, pos)[0]
+            record_key, versions = self._record_decoder.decode(buf[pos + 4:pos + 4 + length])
+            if record_key == key:
+                return versions
+            pos += 4 + length
+        return None
+
+    def _sstable_fd(self, file_path: str) -> int:
+        """LRU cache of open SSTable fds so repeated reads skip open/close"""
+        fd = self._fd_cache.get(file_path)
+        if fd is None:
+            fd = os.open(file_path, os.O_RDONLY)
+            self._fd_cache[file_path] = fd
+            if len(self._fd_cache) > self.FD_CACHE_SIZE:
+                _, evicted = self._fd_cache.popitem(last=False)
+                os.close(evicted)
+        else:
+            self._fd_cache.move_to_end(file_path)
+        return fd
+
+    def _iter_sstable(self, file_path):
+        """Yield every (key, versions) record of an SSTable in order
+
+        The file is mmap'd and decoded through a memoryview, so record
+        payloads reach msgspec without an intermediate bytes copy.
+        """
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        try:
+            pos = 0
+            while pos < size:
+                length = struct.unpack_from(">I", mm, pos)[0]
+                yield self._record_decoder.decode(view[pos + 4:pos + 4 + length])
+                pos += 4 + length
+        finally:
+            view.release()
+            mm.close()
+
+    def _load_bloom(self, file_path: str):
+        """Load the Bloom filter sidecar for an SSTable, caching per process"""
+        if file_path not in self._bloom_cache:
+            bloom_path = file_path[:-4] + ".bloom"
+            if os.path.exists(bloom_path):
+                with open(bloom_path, "rb") as f:
+                    self._bloom_cache[file_path] = BloomFilter.fromfile(f)
+            else:
+                self._bloom_cache[file_path] = None
+        return self._bloom_cache[file_path]
+
+    def _load_namespaces(self):
+        """One directory scan on first use; mutations keep the set in sync"""
+        if self._namespaces is None:
+            with os.scandir(self.kv_root) as it:
+                self._namespaces = {entry.name for entry in it if entry.is_dir()}
+        return self._namespaces
+
+    def _load_tables(self, ns: str):
+        """One directory scan per namespace on first use"""
+        if ns not in self._tables:
+            with os.scandir(self.kv_root / ns) as it:
+                self._tables[ns] = {entry.name for entry in it if entry.is_dir()}
+        return self._tables[ns]
 
     def namespace_exists(self, ns: str) -> bool:
-        return (self.kv_root / ns).is_dir()
+        return ns in self._load_namespaces()
 
     def list_namespaces(self):
-        return [ns.name for ns in self.kv_root.iterdir() if ns.is_dir()]
+        return sorted(self._load_namespaces())
 
     def create_namespace(self, ns: str) -> str:
-        ns_path = self.kv_root / ns
-        if ns_path.exists():
+        if self.namespace_exists(ns):
             return f"[ERROR] Namespace '{ns}' already exists."
-        ns_path.mkdir()
+        (self.kv_root / ns).mkdir()
+        self._namespaces.add(ns)
         return f"[OK] Namespace '{ns}' created successfully."
 
     def use_namespace(self, ns: str) -> str:
@@ -56,86 +408,141 @@ class KVEngine:
         return f"[OK] Using namespace: {ns}"
 
     def table_exists(self, ns: str, table: str) -> bool:
-        return (self.kv_root / ns / table).is_dir()
+        if not self.namespace_exists(ns):
+            return False
+        return table in self._load_tables(ns)
 
     def create_table(self, ns: str, table: str) -> str:
-        ns_path = self.kv_root / ns
-        if not ns_path.exists():
+        if not self.namespace_exists(ns):
             return f"[ERROR] Namespace '{ns}' does not exist."
 
-        table_path = ns_path / table
-        if table_path.exists():
+        if table in self._load_tables(ns):
             return f"[ERROR] Table '{table}' already exists in namespace '{ns}'."
 
-        table_path.mkdir()
+        (self.kv_root / ns / table).mkdir()
+        self._tables[ns].add(table)
         return f"[OK] Table '{table}' created in namespace '{ns}'."
 
     def list_tables(self, ns: str):
-        ns_path = self.kv_root / ns
-        if not ns_path.exists():
+        if not self.namespace_exists(ns):
             return f"[ERROR] Namespace '{ns}' does not exist."
-        
-        return [tbl.name for tbl in ns_path.iterdir() if tbl.is_dir()]
+
+        return sorted(self._load_tables(ns))
 
     def set_key(self, table: str, key: str, value: str, ttl: float = 0):
+        self.set_many(table, [(key, value, ttl)])
+
+    def set_many(self, table: str, items):
+        """Apply a batch of (key, value[, ttl]) writes under one lock
+
+        The whole batch shares a single lock acquisition and a single WAL
+        frame, amortizing both across N operations.
+        """
         if self.current_namespace is None:
             raise ValueError("No namespace selected. Use 'use-namespace' first.")
         if not self.table_exists(self.current_namespace, table):
             raise FileNotFoundError(f"Table '{table}' does not exist in namespace '{self.current_namespace}'.")
 
-        # Write to WAL first
-        self._write_to_wal("SET", table, key, value, ttl)
-
-        table_id = f"{self.current_namespace}:{table}"
-        self.memstore.setdefault(table_id, {})
-        self.memstore[table_id].setdefault(key, [])
-
-        self.memstore[table_id][key].append({
-            "value": value,
-            "timestamp": time.time(),
-            "ttl": ttl
-        })
+        with self._lock:
+            # One clock read per batch, shared by the WAL entries and memstore
+            now = time.time()
+
+            # Write to WAL first: the whole batch as one frame
+            ns = self.current_namespace
+            self._write_wal_entries([
+                WalEntry(now, "SET", ns, table, item[0], item[1],
+                         item[2] if len(item) > 2 else 0)
+                for item in items
+            ])
+
+            table_id = f"{ns}:{table}"
+            store = self.memstore.setdefault(table_id, SortedDict())
+            added_bytes = 0
+            for item in items:
+                key, value = item[0], item[1]
+                ttl = item[2] if len(item) > 2 else 0
+                columns = store.get(key)
+                if columns is None:
+                    columns = store[key] = VersionColumns()
+
+                # Precompute the expiry so reads do one comparison per version
+                columns.append(value, now, now + ttl if ttl else math.inf)
+                self._read_cache.pop((table_id, key), None)
+                added_bytes += len(key) + len(value) + 32
+
+            # Approximate accounting; flush in the background once the
+            # table's memstore crosses MAX_MEM_SIZE
+            self._memstore_bytes[table_id] += added_bytes
+            if self._memstore_bytes[table_id] >= self.MAX_MEM_SIZE:
+                self.flush_table(table)
 
     def get_key(self, table: str, key: str):
         if self.current_namespace is None:
             raise ValueError("No namespace selected. Use 'use-namespace' first.")
 
         table_id = f"{self.current_namespace}:{table}"
-        table_path = self.kv_root / self.current_namespace / table
-
-        # First check memstore
-        if table_id in self.memstore and key in self.memstore[table_id]:
-            versions = self.memstore[table_id][key]
-            for entry in reversed(versions):  # Newest first
-                if entry["ttl"] == 0 or time.time() <= entry["timestamp"] + entry["ttl"]:
-                    if entry["value"] == "_DEL":
-                        return None
-                    return entry["value"]
+        now = time.time()
+
+        with self._lock:
+            return self._get_key_locked(table, table_id, key, now)
+
+    def _get_key_locked(self, table, table_id, key, now):
+        # Hot-key cache: repeated cold reads become one hash lookup
+        cached = self._read_cache.get((table_id, key))
+        if cached is not None:
+            value, expires_at = cached
+            if now <= expires_at:
+                self._read_cache.move_to_end((table_id, key))
+                return value
+            del self._read_cache[(table_id, key)]
+
+        # First check memstore, then pending-flush snapshots newest-first
+        stores = [self.memstore.get(table_id)]
+        stores.extend(reversed(self._frozen.get(table_id, ())))
+        for store in stores:
+            if store is None:
+                continue
+            columns = store.get(key)
+            if columns is None:
+                continue
+            entry = columns.latest_live(now)
+            if entry is not None:
+                if entry.is_tombstone:
+                    return None
+                return entry.value
 
         # If not in memstore, search in table files
-        if table_path.exists():
+        if self.table_exists(self.current_namespace, table):
             all_versions = []
             
-            # Search in all JSON files in the table directory
-            for file_path in table_path.glob("*.json"):
-                try:
-                    with open(file_path, "r") as f:
-                        data = json.load(f)
-                        if key in data:
-                            all_versions.extend(data[key])
-                except Exception as e:
-                    print(f"[WARN] Error reading {file_path}: {e}")
+            # Search in all SSTable files in the table directory
+            for file_path in self._sstable_files(table_id):
+                # Bloom filter says the key is definitely absent -> skip the file
+                bloom = self._load_bloom(file_path)
+                if bloom is not None and key not in bloom:
                     continue
-
-            # Sort all versions by timestamp
-            all_versions.sort(key=lambda x: x["timestamp"])
-
-            # Check versions from newest to oldest
-            for entry in reversed(all_versions):
-                if entry["ttl"] == 0 or time.time() <= entry["timestamp"] + entry["ttl"]:
-                    if entry["value"] == "_DEL":
-                        return None
-                    return entry["value"]
+                # SSTables are written atomically (tmp + os.replace), so no
+                # truncated-file guard is needed on the hot read loop
+                versions = self._read_key_from_sstable(file_path, key)
+                if versions:
+                    all_versions.extend(versions)
+
+            # Single pass for the newest live version; avoids the former
+            # sort-then-reverse-scan over every version. >= keeps the later
+            # write of an equal-timestamp pair (set_many stamps a batch with
+            # one shared clock read), matching the stable sort it replaced
+            best = None
+            for entry in all_versions:
+                if now <= entry.expires_at and (best is None or entry.timestamp >= best.timestamp):
+                    best = entry
+
+            if best is not None:
+                if best.is_tombstone:
+                    return None
+                self._read_cache[(table_id, key)] = (best.value, best.expires_at)
+                if len(self._read_cache) > self.READ_CACHE_SIZE:
+                    self._read_cache.popitem(last=False)
+                return best.value
 
         return None  # Key not found or all versions expired
     
@@ -145,20 +552,24 @@ class KVEngine:
         if not self.table_exists(self.current_namespace, table):
             raise FileNotFoundError(f"Table '{table}' does not exist in namespace '{self.current_namespace}'.")
 
-        # Write to WAL first
-        self._write_to_wal("DELETE", table, key)
+        with self._lock:
+            now = time.time()
 
-        table_id = f"{self.current_namespace}:{table}"
-        if table_id not in self.memstore:
-            self.memstore[table_id] = {}
-        
-        # Mark the key as deleted by adding a _DEL version
-        self.memstore[table_id].setdefault(key, []).append({
-            "value": "_DEL",
-            "timestamp": time.time(),
-            "ttl": 0
-        })
-        return f"[OK] Marked key '{key}' as deleted in table '{table}'."
+            # Write to WAL first
+            self._write_to_wal("DELETE", table, key, timestamp=now)
+
+            table_id = f"{self.current_namespace}:{table}"
+            if table_id not in self.memstore:
+                self.memstore[table_id] = SortedDict()
+
+            # Mark the key as deleted by adding a tombstone version
+            columns = self.memstore[table_id].get(key)
+            if columns is None:
+                columns = self.memstore[table_id][key] = VersionColumns()
+            columns.append("", now, math.inf, is_tombstone=True)
+            self._memstore_bytes[table_id] += len(key) + 36
+            self._read_cache.pop((table_id, key), None)
+            return f"[OK] Marked key '{key}' as deleted in table '{table}'."
     
     def flush_table(self, table: str):
         if self.current_namespace is None:
@@ -166,77 +577,159 @@ class KVEngine:
         if not self.table_exists(self.current_namespace, table):
             raise FileNotFoundError(f"Table '{table}' does not exist in namespace '{self.current_namespace}'.")
 
-        table_id = f"{self.current_namespace}:{table}"
-        if table_id not in self.memstore:
-            return "[WARN] Nothing to flush."
-
-        # Write to WAL first
-        self._write_to_wal("FLUSH", table, "FLUSH")
-
-        table_path = self.kv_root / self.current_namespace / table / f"{int(time.time())}_flush.json"
-        table_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(table_path, "w") as f:
-            json.dump(self.memstore[table_id], f, indent=4)
-
-        del self.memstore[table_id]  # clear flushed data
-        return f"[OK] Flushed {table_id} to {table_path.name}"
+        with self._lock:
+            table_id = f"{self.current_namespace}:{table}"
+            if table_id not in self.memstore:
+                return "[WARN] Nothing to flush."
+
+            now = time.time()
+
+            # Write to WAL first
+            self._write_to_wal("FLUSH", table, "FLUSH", timestamp=now)
+
+            # Unique name keeps same-second flushes (common with auto-flush)
+            # from overwriting each other
+            sst_path = self._new_sstable_path(self._table_dir(table_id), now, "flush")
+
+            # Freeze the memstore snapshot and hand it to the background
+            # writer; new writes go into a fresh dict and never block on
+            # the disk write. Waiting here (while holding the lock) would
+            # deadlock against _do_flush, so snapshots queue up instead.
+            frozen = self.memstore.pop(table_id)
+            self._memstore_bytes.pop(table_id, None)
+            self._frozen.setdefault(table_id, []).append(frozen)
+            future = self._flush_executor.submit(self._do_flush, sst_path, table_id, frozen)
+            self._pending_flushes.append(future)
+            return f"[OK] Flushing {table_id} to {os.path.basename(sst_path)} in background"
+
+    def _new_sstable_path(self, table_dir: str, now: float, suffix: str) -> str:
+        """Unique SSTable name: the sequence number separates same-second
+        writes within this process, and the existence check skips names left
+        on disk by an earlier process (the counter resets on restart)"""
+        self._flush_seq += 1
+        path = os.path.join(table_dir, f"{int(now)}_{self._flush_seq}_{suffix}.sst")
+        while os.path.exists(path):
+            self._flush_seq += 1
+            path = os.path.join(table_dir, f"{int(now)}_{self._flush_seq}_{suffix}.sst")
+        return path
+
+    def _do_flush(self, sst_path, table_id, frozen):
+        """Background half of flush_table: write the frozen snapshot to disk"""
+        self._write_sstable(sst_path, frozen)
+        # Runs on the flush executor thread: retire the snapshot under the
+        # lock so readers never see _frozen mutate mid-lookup
+        with self._lock:
+            snapshots = self._frozen.get(table_id, [])
+            snapshots[:] = [s for s in snapshots if s is not frozen]
+            if not snapshots:
+                self._frozen.pop(table_id, None)
+
+    def wait_flush(self):
+        """Block until all pending background flushes hit disk"""
+        pending, self._pending_flushes = self._pending_flushes, []
+        for future in pending:
+            future.result()
     
+    @staticmethod
+    def _sstable_tier(name: str) -> int:
+        """Tier of an SSTable from its filename; fresh flushes are tier 0"""
+        stem = name.rsplit(".", 1)[0]
+        suffix = stem.rsplit("_", 1)[-1]
+        if suffix.startswith("L") and suffix[1:].isdigit():
+            return int(suffix[1:])
+        return 0
+
+    def _remove_sstable(self, file_path: str):
+        """Delete an SSTable, its sidecars and any cached state for it"""
+        try:
+            os.remove(file_path)
+            for sidecar in (file_path[:-4] + ".idx", file_path[:-4] + ".bloom"):
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+            self._bloom_cache.pop(file_path, None)
+            self._index_cache.pop(file_path, None)
+            fd = self._fd_cache.pop(file_path, None)
+            if fd is not None:
+                os.close(fd)
+        except Exception as e:
+            print(f"[WARN] Error removing {file_path}: {e}")
+
     def compact_table(self, table: str):
         if self.current_namespace is None:
             raise ValueError("No namespace selected. Use 'use-namespace' first.")
         if not self.table_exists(self.current_namespace, table):
             raise FileNotFoundError(f"Table '{table}' does not exist in namespace '{self.current_namespace}'.")
 
-        table_path = self.kv_root / self.current_namespace / table
-        if not table_path.exists():
-            return "[WARN] No files to compact."
-
-        # Read all flush files
-        merged_data = {}
-        for file_path in table_path.glob("*_flush.json"):
-            try:
-                with open(file_path, "r") as f:
-                    data = json.load(f)
-                    for key, versions in data.items():
-                        if key not in merged_data:
-                            merged_data[key] = []
-                        merged_data[key].extend(versions)
-            except Exception as e:
-                print(f"[WARN] Error reading {file_path}: {e}")
-                continue
+        with self._lock:
+            return self._compact_table_locked(table)
 
-        # Clean up data - keep only latest non-deleted versions
-        cleaned_data = {}
-        for key, versions in merged_data.items():
-            # Sort versions by timestamp
-            versions.sort(key=lambda x: x["timestamp"])
-            
-            # Keep only the latest non-deleted version
-            latest_valid = None
-            for version in versions:
-                if version["value"] != "_DEL" and (version["ttl"] == 0 or time.time() <= version["timestamp"] + version["ttl"]):
-                    latest_valid = version
-            
-            if latest_valid:
-                cleaned_data[key] = [latest_valid]
+    def _compact_table_locked(self, table: str):
+        table_id = f"{self.current_namespace}:{table}"
+        table_dir = self._table_dir(table_id)
 
-        # Write compacted data to new file
-        if cleaned_data:
-            new_file = table_path / f"{int(time.time())}_compacted.json"
-            with open(new_file, "w") as f:
-                json.dump(cleaned_data, f, indent=4)
+        # Size-tiered: only merge tiers that accumulated enough files,
+        # promoting the result one tier up
+        all_files = list(self._sstable_files(table_id))
+        if not all_files:
+            return "[WARN] No files to compact."
+        tiers = {}
+        for file_path in all_files:
+            tiers.setdefault(self._sstable_tier(os.path.basename(file_path)), []).append(file_path)
+
+        now = time.time()
+        new_files = []
+        for tier in sorted(tiers):
+            group = tiers[tier]
+            if len(group) < self.COMPACT_TIER_THRESHOLD:
+                continue
 
-            # Remove old files
-            for file_path in table_path.glob("*_flush.json"):
+            # Read all files of this tier, keeping each file's (already
+            # timestamp-ordered) version stream separate per key
+            per_key = {}
+            for file_path in group:
                 try:
-                    file_path.unlink()
+                    for key, versions in self._iter_sstable(file_path):
+                        per_key.setdefault(key, []).append(versions)
                 except Exception as e:
-                    print(f"[WARN] Error removing {file_path}: {e}")
+                    print(f"[WARN] Error reading {file_path}: {e}")
+                    continue
 
-            return f"[OK] Table '{table}' compacted successfully. New file: {new_file.name}"
-        else:
-            return "[WARN] No valid data to compact."
+            # K-way merge of sorted streams: O(N) instead of extend+sort
+            by_timestamp = operator.attrgetter("timestamp")
+            merged_data = {
+                key: list(heapq.merge(*streams, key=by_timestamp))
+                for key, streams in per_key.items()
+            }
+
+            # Dropping tombstones and old versions is only safe when no
+            # other file could hold an older version of the key (major merge)
+            if len(group) == len(all_files):
+                cleaned_data = {}
+                for key, versions in merged_data.items():
+                    # Versions are merged oldest-first, so scan from the tail
+                    # and stop at the first live one; a newest-is-tombstone
+                    # key is dropped instead of resurrecting an older value
+                    latest = None
+                    for version in reversed(versions):
+                        if now <= version.expires_at:
+                            latest = version
+                            break
+
+                    if latest is not None and not latest.is_tombstone:
+                        cleaned_data[key] = [latest]
+                merged_data = cleaned_data
+
+            if merged_data:
+                new_file = self._new_sstable_path(table_dir, now, f"L{tier + 1}")
+                self._write_sstable(new_file, merged_data)
+                new_files.append(os.path.basename(new_file))
+
+            for file_path in group:
+                self._remove_sstable(file_path)
+
+        if new_files:
+            return f"[OK] Table '{table}' compacted successfully. New file: {', '.join(new_files)}"
+        return "[WARN] No tier has enough files to compact."
     
 if __name__ == "__main__":
     engine = KVEngine()